@@ -1,14 +1,36 @@
-from math import sqrt, pi, sin
+from math import sqrt, sin, radians, hypot
 from serial import Serial, PARITY_NONE, STOPBITS_ONE, EIGHTBITS
 from json import load
-from numpy import array, linspace, float64
-from matplotlib.pyplot import pause, figure, ion
-from scipy.interpolate import splprep, splev
-from keyboard import is_pressed
+from numpy import (
+    column_stack,
+    concatenate,
+    cumsum,
+    diff,
+    empty,
+    hypot as arrayHypot,
+    linspace,
+    loadtxt,
+    resize,
+    savetxt,
+    unique,
+    float64,
+    int32,
+)
+from matplotlib.pyplot import figure, ion
+from scipy.interpolate import make_interp_spline
+from keyboard import add_hotkey
+from queue import Queue, Empty
+from typing import Iterator
 from time import sleep
-from csv import writer
+
+try:
+    # optional, swaps in the multi-threaded oneDAL DBSCAN when installed
+    from sklearnex import patch_sklearn
+
+    patch_sklearn("dbscan", verbose=False)
+except ImportError:
+    pass
 from sklearn.cluster import DBSCAN
-from pandas import read_csv
 from termcolor import colored
 
 """
@@ -45,10 +67,14 @@ X_MIN = 0
 X_MAX = LENGTH - LENGTH_BUFFER
 Y_MIN = 0
 Y_MAX = BREADTH - BREADTH_BUFFER
+PLOT_EVERY: int = parameters["plot every"]
+"""number of points acquired between two consecutive redraws"""
 
 # constants related to spine interpolation
 SPLINE_MAXIMUM_POINTS: int = parameters["spline interpolation"]["maximum points"]
 """number of maximum points in a linear curve"""
+SPLINE_MINIMUM_DISTANCE: float = parameters["spline interpolation"]["minimum distance"]
+"""points closer than this to the previous point are not interpolated"""
 
 # constants for DBSCAN outlier detection algorithm
 EPS: float = parameters["dbscan"]["eps"]
@@ -72,16 +98,95 @@ BACK = "z"
 # constants related to serial communication
 PORT = parameters["serial"]["port"]
 BAUD = parameters["serial"]["baud"]
-
-
-# helper methods
-degreeToRadian = lambda degree: degree * pi / 180
-sq = lambda n: n * n
-distanceBetweenPoints = lambda a1, b1, a2, b2: sqrt(sq(a1 - a2) + sq(b1 - b2))
+SERIAL_TIMEOUT: float = parameters["serial"]["timeout"]
+"""seconds a read waits for incoming data"""
 
 # derived model parameters
-COUNTER_TO_LENGTH: int = LENGTH / (2 * sin(degreeToRadian(THETA_LENGTH)))
-COUNTER_TO_BREADTH: int = BREADTH / (2 * sin(degreeToRadian(THETA_BREADTH)))
+COUNTER_TO_LENGTH: int = LENGTH / (2 * sin(radians(THETA_LENGTH)))
+COUNTER_TO_BREADTH: int = BREADTH / (2 * sin(radians(THETA_BREADTH)))
+
+# range of valid distances from the length and breadth sensors
+DL_MINIMUM: float = COUNTER_TO_LENGTH + BREADTH_BUFFER / 2
+DL_MAXIMUM: float = hypot(
+    COUNTER_TO_LENGTH + BREADTH - BREADTH_BUFFER / 2,
+    LENGTH / 2 - LENGTH_BUFFER / 2,
+)
+DB_MINIMUM: float = COUNTER_TO_BREADTH + LENGTH_BUFFER / 2
+DB_MAXIMUM: float = hypot(
+    COUNTER_TO_BREADTH + LENGTH - LENGTH_BUFFER / 2,
+    BREADTH / 2 - BREADTH_BUFFER / 2,
+)
+
+# sensor positions used by mapToCoordinate
+LENGTH_SENSOR_X: float = LENGTH / 2
+LENGTH_SENSOR_Y: float = BREADTH + COUNTER_TO_LENGTH
+BREADTH_SENSOR_X: float = LENGTH + COUNTER_TO_BREADTH
+BREADTH_SENSOR_Y: float = BREADTH / 2
+SENSOR_DISTANCE: float = hypot(
+    LENGTH_SENSOR_X - BREADTH_SENSOR_X, LENGTH_SENSOR_Y - BREADTH_SENSOR_Y
+)
+# unit vector pointing from the length sensor towards the breadth sensor
+SENSOR_UNIT_X: float = (BREADTH_SENSOR_X - LENGTH_SENSOR_X) / SENSOR_DISTANCE
+SENSOR_UNIT_Y: float = (BREADTH_SENSOR_Y - LENGTH_SENSOR_Y) / SENSOR_DISTANCE
+
+
+class PointBuffer:
+    """growable structure of arrays storing 2d points, only the first n entries are valid"""
+
+    __slots__ = ("x", "y", "n", "cap")
+
+    def __init__(self, cap: int = 1024):
+        self.x = empty(cap, dtype=float64)
+        self.y = empty(cap, dtype=float64)
+        self.n = 0
+        self.cap = cap
+
+    def __len__(self) -> int:
+        return self.n
+
+    def reserve(self, cap: int) -> None:
+        """grows the buffer by doubling until it can hold cap points"""
+        if cap <= self.cap:
+            return
+        while self.cap < cap:
+            self.cap *= 2
+        self.x = resize(self.x, self.cap)
+        self.y = resize(self.y, self.cap)
+
+    def append(self, a: float, b: float) -> None:
+        self.reserve(self.n + 1)
+        self.x[self.n] = a
+        self.y[self.n] = b
+        self.n += 1
+
+    def extend(self, xs, ys) -> None:
+        count = len(xs)
+        self.reserve(self.n + count)
+        self.x[self.n : self.n + count] = xs
+        self.y[self.n : self.n + count] = ys
+        self.n += count
+
+    def replace(self, xs, ys) -> None:
+        """replaces the stored points with the provided ones"""
+        self.n = 0
+        self.extend(xs, ys)
+
+    def pop(self) -> None:
+        """removes the last point if any"""
+        if self.n > 0:
+            self.n -= 1
+
+    def clear(self) -> None:
+        self.n = 0
+
+    def view(self):
+        """returns the valid x and y values as array views (no copy)"""
+        return self.x[: self.n], self.y[: self.n]
+
+    def contains(self, a: float, b: float) -> bool:
+        """checks whether the point (a, b) is already stored"""
+        x, y = self.view()
+        return bool(((x == a) & (y == b)).any())
 
 
 # serial port initialization
@@ -91,15 +196,16 @@ ser = Serial(
     parity=PARITY_NONE,
     stopbits=STOPBITS_ONE,
     bytesize=EIGHTBITS,
-    timeout=0,
+    timeout=SERIAL_TIMEOUT,
 )
 
 counter = 0
+readings = empty((AVERAGE_OF_READINGS, 2), dtype=int32)  # mapped readings that get averaged
 
 a, b = 0, 0  # current points
-x, y = [], []  # regular points
+regularPoints = PointBuffer()
 # points that are to be interpolated and then get added to the points
-xToInterpolate, yToInterpolate = [], []
+pointsToInterpolate = PointBuffer()
 xInterpolated, yInterpolated = [], []  # interpolated points
 
 ion()
@@ -107,214 +213,265 @@ fig = figure()
 axis = fig.add_subplot(111)
 axis.set_xlim(X_MIN, X_MAX)
 axis.set_ylim(Y_MIN, Y_MAX)
+# persistent artists, only their data is updated while drawing
+# regular points can grow large, a scatter draws them all with a single shared marker path
+regularScatter = axis.scatter([], [], c="b", s=36, animated=True)
+(toInterpolateLine,) = axis.plot([], [], "bo", animated=True)
+(interpolatedLine,) = axis.plot([], [], "b-", animated=True)
 fig.show()
+fig.canvas.draw()
+background = fig.canvas.copy_from_bbox(axis.bbox)
+
+
+def captureBackground(event) -> None:
+    """re-captures the static background whenever the canvas is fully redrawn"""
+    global background
+    background = fig.canvas.copy_from_bbox(axis.bbox)
+    # animated artists are left out of a full draw, put the drawing back on top
+    for artist in (regularScatter, toInterpolateLine, interpolatedLine):
+        axis.draw_artist(artist)
+
+
+fig.canvas.mpl_connect("draw_event", captureBackground)
 
-(interpolatedLine,) = axis.plot([], [], "bo")
 interpolate = False
 outlier_detection = True
 skip = SKIP_COUNT
 
-def getSerialInput() -> str:
-    """returns serial input without parsing"""
-    tmp = ser.readline()
-    tmp = tmp.replace(b"\n", b"").replace(b"\r", b"")
-    tmp = tmp.decode("utf")
-    return tmp
+# key presses are queued by the keyboard hook and handled from the main loop
+keyPresses = Queue()
+for key in (
+    CLEAR,
+    INTERPOLATION_ACTIVATED,
+    INTERPOLATION_DEACTIVATED,
+    OUTLIER_REMOVAL,
+    SAVE,
+    IMPORT_FROM_CSV,
+    BREAK_OUTLIER_DETECTION,
+    BACK,
+):
+    # triggering on release fires once per press even if the key is held down
+    add_hotkey(key, keyPresses.put, args=(key,), trigger_on_release=True)
+
+
+def getSerialInput() -> Iterator[str]:
+    """yields serial input line by line without parsing, an empty string whenever no complete line is available yet"""
+    buffer = bytearray()
+    while True:
+        # one read per step takes everything that has arrived so far
+        buffer += ser.read(ser.in_waiting or 1)
+        if b"\n" not in buffer:
+            yield ""
+            continue
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()  # incomplete tail, completed by later reads
+        for line in lines:
+            yield line.translate(None, b"\r").decode("ascii", "replace")
 
 
-def decodeInput(tmp: str):
-    """decodes input and returns a 2d point"""
-    tmp = tmp[:-1]
-    a: int = int(tmp[: tmp.index(",")])
-    b: int = int(tmp[tmp.index(",") + 1 :])
-    return (a, b)
+serialInput = getSerialInput()
 
 
-def isInputValid(tmp: str) -> bool:
-    """checks whether input is valid or not"""
-    return (
-        sum([1 for i in tmp.split(",") if i != ""]) == 2
-        and sum([1 for i in tmp if i == ","]) == 2
-    )
+def parseInput(tmp: str):
+    """parses input of the form "dL,dB," and returns the 2 distances, None if the input is invalid"""
+    left, sep, rest = tmp.partition(",")
+    middle, sep2, tail = rest.partition(",")
+    if not sep2 or tail:
+        return None
+    try:
+        return (int(left), int(middle))
+    except ValueError:
+        return None
 
 
 def isReadingValid(dL: int, dB: int) -> bool:
     """check whether the provided distances are valid or not in accordance with specified parameters"""
-    dLMin: int = COUNTER_TO_LENGTH + BREADTH_BUFFER / 2
-    dLMax: int = sqrt(
-        sq(COUNTER_TO_LENGTH + BREADTH - BREADTH_BUFFER / 2)
-        + sq(LENGTH / 2 - LENGTH_BUFFER / 2)
-    )
-    dBMin: int = COUNTER_TO_BREADTH + LENGTH_BUFFER / 2
-    dBMax: int = sqrt(
-        sq(COUNTER_TO_BREADTH + LENGTH - LENGTH_BUFFER / 2)
-        + sq(BREADTH / 2 - BREADTH_BUFFER / 2)
-    )
-    return dL >= dLMin and dL <= dLMax and dB >= dBMin and dB <= dBMax
+    return DL_MINIMUM <= dL <= DL_MAXIMUM and DB_MINIMUM <= dB <= DB_MAXIMUM
 
 
 def mergeInterpolatedPoints() -> None:
     """adding interpolated points to general points and clearing interpolated and to_interpolate arrays"""
-    global x, y, xInterpolated, yInterpolated, xToInterpolate, yToInterpolate
-    x.extend(xInterpolated)
-    y.extend(yInterpolated)
-    xInterpolated, yInterpolated, xToInterpolate, yToInterpolate = [], [], [], []
+    global xInterpolated, yInterpolated
+    regularPoints.extend(xInterpolated, yInterpolated)
+    pointsToInterpolate.clear()
+    xInterpolated, yInterpolated = [], []
 
 
 def plotTheDrawing() -> None:
     """Function to plot the points"""
-    axis.cla()
-    axis.plot(x, y, "bo")
-    axis.plot(xToInterpolate, yToInterpolate, "bo")
-    axis.plot(xInterpolated, yInterpolated, "b-")
-    axis.set_xlim(X_MIN, X_MAX)
-    axis.set_ylim(Y_MIN, Y_MAX)
-    fig.canvas.draw()
+    regularScatter.set_offsets(column_stack(regularPoints.view()))
+    toInterpolateLine.set_data(*pointsToInterpolate.view())
+    interpolatedLine.set_data(xInterpolated, yInterpolated)
+    fig.canvas.restore_region(background)
+    for artist in (regularScatter, toInterpolateLine, interpolatedLine):
+        axis.draw_artist(artist)
+    fig.canvas.blit(axis.bbox)
+    fig.canvas.flush_events()
 
 
 def removeOutliers() -> None:
     """removes outliers present in the plot using DBSCAN algorithm"""
     print(colored("OUTLIER DETECTION TRIGGERED", "green"))
-    global x, y
     # mergeInterpolatedPoints()
-    points = [[x[i], y[i]] for i in range(len(x))]
-    if len(points) < MINIMUM_SAMPLES:
+    if len(regularPoints) < MINIMUM_SAMPLES:
         return
-    model = DBSCAN(eps=EPS, min_samples=MINIMUM_SAMPLES).fit(points)
-    inliers = [
-        points[record] for record in range(len(points)) if model.labels_[record] != -1
-    ]
-    x = [record[0] for record in inliers]
-    y = [record[1] for record in inliers]
+    x, y = regularPoints.view()
+    points = column_stack((x, y))
+    # repeated readings are fitted once, weighted by how often they occur
+    distinct, inverse, counts = unique(
+        points, axis=0, return_inverse=True, return_counts=True
+    )
+    labels = DBSCAN(eps=EPS, min_samples=MINIMUM_SAMPLES, n_jobs=-1).fit(
+        distinct, sample_weight=counts
+    ).labels_
+    # every point gets the label of its distinct point
+    inliers = labels[inverse.reshape(-1)] != -1
+    regularPoints.replace(x[inliers], y[inliers])
     plotTheDrawing()
 
 
 def savePointsToCSV(fileName: str) -> None:
     """saves points to CSV file with fileName"""
     mergeInterpolatedPoints()
-    points = [[x[i], y[i]] for i in range(len(x))]
-    with open(fileName, "w") as file:
-        writer(file).writerows(points)
+    savetxt(fileName, column_stack(regularPoints.view()), fmt="%.17g", delimiter=",")
 
 
 def importCSVFileToPoints(fileName: str) -> None:
     """imports points present in the CSV file"""
-    global x, y
     mergeInterpolatedPoints()
-    points = read_csv(fileName, header=None, sep=",").iloc[:, 0:2].values
-    x = [record[0] for record in points]
-    y = [record[1] for record in points]
+    points = loadtxt(fileName, delimiter=",", usecols=(0, 1), ndmin=2)
+    regularPoints.replace(points[:, 0], points[:, 1])
     plotTheDrawing()
 
 
+def discardKeyPresses() -> None:
+    """drops the queued key presses, e.g. keys typed while entering a file name"""
+    while True:
+        try:
+            keyPresses.get_nowait()
+        except Empty:
+            return
+
+
 def checkForKeyPress():
-    global x, y, xToInterpolate, yToInterpolate, xInterpolated, yInterpolated
+    """handles the key presses queued since the last call"""
+    while True:
+        try:
+            key = keyPresses.get_nowait()
+        except Empty:
+            return
+        handleKeyPress(key)
+
+
+def handleKeyPress(key: str) -> None:
+    global xInterpolated, yInterpolated
     global interpolate, outlier_detection
-    if is_pressed(CLEAR):
+    if key == CLEAR:
         print(colored("CLEAR", "green"))
-        x, y = [], []
-        xToInterpolate, yToInterpolate = [], []
+        regularPoints.clear()
+        pointsToInterpolate.clear()
         xInterpolated, yInterpolated = [], []
         plotTheDrawing()
-    elif is_pressed(INTERPOLATION_ACTIVATED) and not interpolate:
+    elif key == INTERPOLATION_ACTIVATED and not interpolate:
         interpolate = True
         print(colored("INTERPOLATION ACTIVATED", "green"))
-    elif is_pressed(INTERPOLATION_DEACTIVATED) and interpolate:
+        plotTheDrawing()
+    elif key == INTERPOLATION_DEACTIVATED and interpolate:
         interpolate = False
         print(colored("INTERPOLATION DEACTIVATED", "green"))
         mergeInterpolatedPoints()
-    elif is_pressed(OUTLIER_REMOVAL) and not outlier_detection:
+        plotTheDrawing()
+    elif key == OUTLIER_REMOVAL and not outlier_detection:
         outlier_detection = True
         print(colored("OUTLIER DETECTION ACTIVATED", "green"))
         removeOutliers()
-    elif is_pressed(SAVE):
+    elif key == SAVE:
         fileName: str = input(colored("Enter save file name: ", "purple")) + ".csv"
+        discardKeyPresses()
         savePointsToCSV(fileName)
-    elif is_pressed(IMPORT_FROM_CSV):
+        plotTheDrawing()
+    elif key == IMPORT_FROM_CSV:
         fileName: str = input(colored("Enter import file name: ", "purple")) + ".csv"
+        discardKeyPresses()
         importCSVFileToPoints(fileName)
-    elif is_pressed(BREAK_OUTLIER_DETECTION) and outlier_detection:
+    elif key == BREAK_OUTLIER_DETECTION and outlier_detection:
         outlier_detection = False
         print(colored("OUTLIER DETECTION DEACTIVATED", "green"))
-    elif is_pressed(BACK):
-        if not interpolate and len(x) > 0:
-            x = x[:-1]
-            y = y[:-1]
-        if interpolate and len(xToInterpolate) > 0:
-            xToInterpolate = xToInterpolate[:-1]
-            yToInterpolate = yToInterpolate[:-1]
+    elif key == BACK:
+        if not interpolate:
+            regularPoints.pop()
+        if interpolate and len(pointsToInterpolate) > 0:
+            pointsToInterpolate.pop()
             updateInterpolation()
         plotTheDrawing()
 
+
 def mapToCoordinate(dL: int, dB: int):
     """maps the provided distances to a interger coordinate/point in the first quadrant of the cartesian plane"""
-    p: float = dL
-    q: float = LENGTH / 2
-    r: float = BREADTH + COUNTER_TO_LENGTH
-    u: float = dB
-    v: float = LENGTH + COUNTER_TO_BREADTH
-    w: float = BREADTH / 2
-    e: float = sqrt(sq(q - v) + sq(r - w))
-    f: float = (sq(p) - sq(u) + sq(e)) / (2 * e)
-    g: float = sqrt(sq(p) - sq(f))
+    # f: distance along the line joining the sensors, g: distance perpendicular to it
+    f: float = (dL * dL - dB * dB + SENSOR_DISTANCE * SENSOR_DISTANCE) / (
+        2 * SENSOR_DISTANCE
+    )
+    g: float = sqrt(dL * dL - f * f)
     return (
-        int((f / e) * (v - q) + (g / e) * (w - r) + q) % LENGTH,
-        int((f / e) * (w - r) - (g / e) * (v - q) + r) % BREADTH,
+        int(f * SENSOR_UNIT_X + g * SENSOR_UNIT_Y + LENGTH_SENSOR_X) % LENGTH,
+        int(f * SENSOR_UNIT_Y - g * SENSOR_UNIT_X + LENGTH_SENSOR_Y) % BREADTH,
     )
 
 
 def getCoordinate():
     validCoordinates: int = 0
-    m, n = 0, 0
     while validCoordinates < AVERAGE_OF_READINGS:
         sleep(0.02)
         checkForKeyPress()
-        serialInput = getSerialInput()
-        if not isInputValid(serialInput):
+        reading = parseInput(next(serialInput))
+        if reading is None:
             continue
         # now we have a valid input
-        dL, dB = decodeInput(serialInput)
+        dL, dB = reading
         # dL, dB = 243, 243
         if not isReadingValid(dL, dB):
             continue
         # now we have a valid reading
-        p, q = mapToCoordinate(dL, dB)
-        m += p
-        n += q
+        readings[validCoordinates] = mapToCoordinate(dL, dB)
         validCoordinates += 1
-    return (m // AVERAGE_OF_READINGS, n // AVERAGE_OF_READINGS)
+    m, n = (readings.sum(axis=0) // AVERAGE_OF_READINGS).tolist()
+    return (m, n)
 
 
 def updateInterpolation() -> None:
     global xInterpolated, yInterpolated
-    if interpolate and len(xToInterpolate) > 2:
-        xNpArray = array(xToInterpolate, dtype=float64)
-        yNpArray = array(yToInterpolate, dtype=float64)
-        tck, _ = splprep([xNpArray, yNpArray], k=2, s=0)
-        xInterpolated, yInterpolated = splev(
-            linspace(0, 1, SPLINE_MAXIMUM_POINTS), tck
-        )
+    if interpolate and len(pointsToInterpolate) > 2:
+        xs, ys = pointsToInterpolate.view()
+        # chord length parameterisation, same as the one splprep uses
+        u = concatenate(([0], cumsum(arrayHypot(diff(xs), diff(ys)))))
+        u /= u[-1]
+        spline = make_interp_spline(u, column_stack((xs, ys)), k=2)
+        xy = spline(linspace(0, 1, SPLINE_MAXIMUM_POINTS))
+        xInterpolated, yInterpolated = xy[:, 0], xy[:, 1]
     else:
         xInterpolated = []
         yInterpolated = []
         interpolatedLine.set_data(xInterpolated, yInterpolated)
 
-def drawInterpolation() -> None:
-    global xToInterpolate, yToInterpolate
+def appendInterpolationPoint() -> None:
+    """appends the current point to the points that are to be interpolated"""
+    if len(pointsToInterpolate) > 0:
+        xs, ys = pointsToInterpolate.view()
+        if hypot(a - xs[-1], b - ys[-1]) < SPLINE_MINIMUM_DISTANCE:
+            # too close to the previous point, refitting would not change the curve
+            return
+    if pointsToInterpolate.contains(a, b):
+        # repeated points break the spline fit
+        return
     # appending new points to the coordinates
-    if (a, b) not in set([(xToInterpolate[i], yToInterpolate[i]) for i in range(len(xToInterpolate))]):
-        xToInterpolate.append(a)
-        yToInterpolate.append(b)
+    pointsToInterpolate.append(a, b)
     updateInterpolation()
-    plotTheDrawing()
 
 
-def drawPoint() -> None:
-    """draws a point on the plot"""
-    global x, y
-    x.append(a)
-    y.append(b)
-    plotTheDrawing()
+def appendPoint() -> None:
+    """appends the current point to the regular points"""
+    regularPoints.append(a, b)
 
 
 # driver code
@@ -328,16 +485,19 @@ while True:
     if a < 0 or b < 0:
         print(colored("Error: Wrong coordinates!", "red"))
 
-    plotTheDrawing()
     if skip > 0:
         skip -= 1
         continue
     if interpolate:
-        drawInterpolation()
+        appendInterpolationPoint()
     else:
-        drawPoint()
+        appendPoint()
     skip = SKIP_COUNT
 
     counter += 1
+    if counter % PLOT_EVERY == 0:
+        plotTheDrawing()
     print(colored(f"Point: ({a}, {b})", "blue"))
-    pause(0.05)
\ No newline at end of file
+    # keep the window responsive without pause's redraw of the whole figure
+    fig.canvas.flush_events()
+    sleep(0.05)